@@ -1,34 +1,89 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime
 import json
+import time
 
 st.set_page_config(page_title="StFx MBB Tagger (Streamlit)", layout="wide")
 
+EVENT_FIELDS = ["opponent", "game_date", "quarter", "result", "timestamp_iso", "label"]
+QUARTERS = ["Q1", "Q2", "Q3", "Q4", "OT"]
+RESULTS = ["Made 2", "Made 3", "Missed 2", "Missed 3", "Foul"]
+
+def new_events():
+    # Column-oriented store: one list per field, appended to in lockstep
+    return {f: [] for f in EVENT_FIELDS}
+
 # ---------- Session State Init ----------
 if "buttons" not in st.session_state:
     st.session_state.buttons = [
         {"label": "Pick and Roll", "color": "#3f51b5"},
     ]
 
+if "button_labels_lower" not in st.session_state:
+    st.session_state.button_labels_lower = {b["label"].lower() for b in st.session_state.buttons}
+
 if "events" not in st.session_state:
-    st.session_state.events = []  # list of dicts: opponent, game_date, quarter, result, timestamp_iso, label
+    st.session_state.events = new_events()
+
+if "events_version" not in st.session_state:
+    st.session_state.events_version = 0  # bumped on every append/undo/reset
 
 if "pending_tag" not in st.session_state:
     st.session_state.pending_tag = None  # holds label if a button was clicked
 
-def compute_counts():
-    counts = {}
-    for ev in st.session_state.events:
-        key = (ev["label"], ev["quarter"], ev["result"])
-        counts[key] = counts.get(key, 0) + 1
-    return counts
+def _in_game_order(values, order):
+    # Known values first, in game order; anything else is kept and sorted after them
+    extra = sorted(set(values) - set(order))
+    return pd.Categorical(values, categories=order + extra)
+
+def compute_counts(df_events):
+    df_counts = (
+        df_events.groupby(["label", "quarter", "result"], sort=False)
+        .size()
+        .reset_index(name="Total")
+        .rename(columns={"label": "Tag", "quarter": "Quarter", "result": "Result"})
+    )
+    # Game order (Q1..OT, Made..Foul) is applied to the small summary, not per event
+    df_counts["Quarter"] = _in_game_order(df_counts["Quarter"], QUARTERS)
+    df_counts["Result"] = _in_game_order(df_counts["Result"], RESULTS)
+    return df_counts.sort_values(["Tag", "Quarter", "Result"], ignore_index=True)
+
+def build_events_df(events):
+    return pd.DataFrame(events, columns=EVENT_FIELDS)
+
+def aggregate(df_events):
+    df_counts = compute_counts(df_events)
+    # Chart gets only the finished summary rows; Vega runs no transforms or aggregates
+    # Series label comes straight from the category codes, no string building per row
+    quarters = df_counts["Quarter"].cat.categories
+    results = df_counts["Result"].cat.categories
+    series_codes = (
+        df_counts["Quarter"].cat.codes.to_numpy(dtype="int64") * len(results)
+        + df_counts["Result"].cat.codes.to_numpy(dtype="int64")
+    )
+    df_chart = pd.DataFrame({
+        "Tag": df_counts["Tag"],
+        "Series": pd.Categorical.from_codes(series_codes, categories=[f"{q}_{r}" for q in quarters for r in results]),
+        "Total": df_counts["Total"],
+    })
+    return df_counts, df_chart
+
+# Plain Vega-Lite spec; avoids building (and validating) an Altair chart on every rerun
+COUNTS_CHART_SPEC = {
+    "mark": "bar",
+    "encoding": {
+        "x": {"field": "Tag", "type": "nominal"},
+        "y": {"field": "Total", "type": "quantitative"},
+        "color": {"field": "Series", "type": "nominal"},
+    },
+    "height": 400,
+}
 
 # ---------- Sidebar: Game Meta & Admin ----------
 st.sidebar.header("Game Info")
 opponent = st.sidebar.text_input("Opponent", placeholder="e.g., Acadia", key="opponent")
 game_date = st.sidebar.date_input("Game Date", key="game_date")
-quarter = st.sidebar.selectbox("Quarter", ["", "Q1", "Q2", "Q3", "Q4", "OT"], index=0, key="quarter")
+quarter = st.sidebar.selectbox("Quarter", ["", *QUARTERS], index=0, key="quarter")
 st.sidebar.caption("Opponent, Date, and Quarter are required before you can tag.")
 
 st.sidebar.header("Buttons")
@@ -40,10 +95,11 @@ with st.sidebar.form("new_btn_form", clear_on_submit=True):
         lbl = (new_label or "").strip()
         if not lbl:
             st.sidebar.error("Label is required.")
-        elif any(b["label"].lower() == lbl.lower() for b in st.session_state.buttons):
+        elif lbl.lower() in st.session_state.button_labels_lower:
             st.sidebar.error("That label already exists.")
         else:
             st.session_state.buttons.append({"label": lbl, "color": new_color})
+            st.session_state.button_labels_lower.add(lbl.lower())
             st.sidebar.success(f"Added: {lbl}")
 
 st.sidebar.subheader("Layout")
@@ -73,20 +129,24 @@ if uploaded is not None:
             st.sidebar.error("No valid buttons found in uploaded layout.")
         else:
             st.session_state.buttons = cleaned
+            st.session_state.button_labels_lower = {b["label"].lower() for b in cleaned}
             st.sidebar.success(f"Loaded {len(cleaned)} buttons.")
     except Exception as e:
         st.sidebar.error(f"Failed to load: {e}")
 
 st.sidebar.subheader("Session")
 if st.sidebar.button("Undo Last Tag", use_container_width=True):
-    if st.session_state.events:
-        st.session_state.events.pop()
+    if st.session_state.events["label"]:
+        for col in st.session_state.events.values():
+            col.pop()
+        st.session_state.events_version += 1
         st.sidebar.success("Undid last tag.")
     else:
         st.sidebar.info("No events to undo.")
 
 if st.sidebar.button("Reset Counts", use_container_width=True):
-    st.session_state.events = []
+    st.session_state.events = new_events()
+    st.session_state.events_version += 1
     st.sidebar.success("Cleared all events.")
 
 # ---------- Main: Tagging UI ----------
@@ -115,7 +175,7 @@ if st.session_state.pending_tag:
     st.subheader(f"Result for: {st.session_state.pending_tag}")
     result = st.radio(
         "Select outcome",
-        ["Made 2", "Made 3", "Missed 2", "Missed 3", "Foul"],
+        RESULTS,
         horizontal=True,
         key="result_choice"
     )
@@ -125,37 +185,49 @@ if st.session_state.pending_tag:
             "game_date": str(game_date),
             "quarter": quarter,
             "result": result,
-            "timestamp_iso": datetime.now().isoformat(timespec="seconds"),
+            "timestamp_iso": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime()),
             "label": st.session_state.pending_tag,
         }
-        st.session_state.events.append(ev)
+        for f, v in ev.items():
+            st.session_state.events[f].append(v)
+        st.session_state.events_version += 1
         st.toast(f"Tagged: {st.session_state.pending_tag} ({quarter}, {result})", icon="✅")
         st.session_state.pending_tag = None  # reset
 
+# ---------- Render Cache ----------
+# Frames for Totals and Recent Events are rebuilt only when events_version has
+# moved since they were last built
+render_cache = st.session_state.setdefault("_render_cache", {"version": -1})
+n_events = len(st.session_state.events["label"])
+if render_cache["version"] != st.session_state.events_version:
+    render_cache.clear()  # don't keep the previous frames/CSV around once events are gone
+    if n_events:
+        df_events = build_events_df(st.session_state.events)
+        df_counts, df_chart = aggregate(df_events)
+        render_cache.update(
+            df_counts=df_counts,
+            df_chart=df_chart,
+            df_recent=df_events.sort_values("timestamp_iso", ascending=False),
+            csv=df_events.to_csv(index=False).encode("utf-8"),
+        )
+    render_cache["version"] = st.session_state.events_version
+
 # ---------- Totals ----------
 st.subheader("Totals")
-counts = compute_counts()
-if counts:
-    df_counts = pd.DataFrame(
-        [{"Tag": k[0], "Quarter": k[1], "Result": k[2], "Total": v} for k, v in sorted(counts.items())]
-    )
-    st.dataframe(df_counts, use_container_width=True, hide_index=True)
+if n_events:
+    st.dataframe(render_cache["df_counts"], use_container_width=True, hide_index=True)
 
     # ---------- Analytics Chart ----------
     st.subheader("Analytics Chart")
-    pivot = df_counts.pivot_table(index="Tag", columns=["Quarter", "Result"], values="Total").fillna(0)
-    pivot.columns = [f"{q}_{r}" for q, r in pivot.columns]  # flatten MultiIndex
-    st.bar_chart(pivot)
+    st.vega_lite_chart(render_cache["df_chart"], COUNTS_CHART_SPEC, use_container_width=True)
 else:
     st.write("No tags yet.")
 
 # ---------- Recent Events ----------
 st.subheader("Recent Events")
-if st.session_state.events:
-    df_events = pd.DataFrame(st.session_state.events)
-    st.dataframe(df_events.sort_values("timestamp_iso", ascending=False), use_container_width=True, hide_index=True)
-    csv = df_events.to_csv(index=False).encode("utf-8")
-    st.download_button("Export CSV", data=csv, file_name="tag_events.csv", mime="text/csv")
+if n_events:
+    st.dataframe(render_cache["df_recent"], use_container_width=True, hide_index=True)
+    st.download_button("Export CSV", data=render_cache["csv"], file_name="tag_events.csv", mime="text/csv")
 else:
     st.write("No events yet.")
 